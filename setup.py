@@ -11,7 +11,7 @@ with open('HISTORY.rst') as history_file:
     history = history_file.read()
 
 requirements = [
-    'SQLAlchemy>=1.3.8',
+    'SQLAlchemy>=1.4.40',
     'python-dateutil>=2.8.1',
 ],
 
@@ -22,20 +22,20 @@ test_requirements = ['pytest>=3', ]
 setup(
     author="Ed J",
     author_email='mohawk2@users.noreply.github.com',
-    python_requires='>=3.5',
+    python_requires='>=3.6',
     classifiers=[
         'Development Status :: 2 - Pre-Alpha',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
         'Natural Language :: English',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
     ],
     description="SQLAlchemy utilities for normalising / denormalising table data, useful for CSV",
     install_requires=requirements,
+    extras_require={'arrow': ['pyarrow>=7']},
     license="MIT license",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
@@ -11,46 +11,134 @@ allows more human-friendly data editing in e.g. a spreadsheet.
 
 Example::
 
-    from sqlalchemy_csv_normalise import denormalise_prepare
-    q, col_names = denormalise_prepare(db.session, table)
+    from sqlalchemy_csv_normalise import denormalise_to_csv
     filename = table_to_filename(table)
     with open(filename, 'w', newline='') as csv_file:
-        csv_file_writer = csv.writer(csv_file)
-        csv_file_writer.writerow(col_names)
-        csv_file_writer.writerows(q.all())
+        denormalise_to_csv(db.session, table, csv.writer(csv_file))
+
+    from sqlalchemy_csv_normalise import bulk_load_csv
+    filename = table_to_filename(table)
+    with open(filename, newline='') as csv_file:
+        bulk_load_csv(db.session, table, csv.DictReader(csv_file),
+            inplace=True)
+    db.session.commit()
+
+The lower-level functions `bulk_load_csv` uses are also available, if
+you need to do other things with the rows::
 
     from sqlalchemy_csv_normalise import renormalise_prepare, empty_deleter,\
         type_coercer
-    row_maker = renormalise_prepare(db.session, table)
-    row_cleaner = empty_deleter(table)
-    row_coercer = type_coercer(table)
+    row_maker = renormalise_prepare(db.session, table, inplace=True)
+    row_cleaner = empty_deleter(table, inplace=True)
+    row_coercer = type_coercer(table, inplace=True)
     filename = table_to_filename(table)
     with open(filename, newline='') as csv_file:
-        for d in csv.DictReader(csv_file):
-            row = row_coercer(row_cleaner(row_maker(d)))
-            db.session.add(table(**row))
+        rows = [ row_coercer(row_cleaner(row_maker(d)))
+            for d in csv.DictReader(csv_file) ]
+    db.session.bulk_insert_mappings(table, rows)
     db.session.commit()
+
+`csv.DictReader` makes a new dict for each row, which nothing else uses,
+so it is safe to use `inplace=True` as above, which saves copying each
+row once per function.
 """
 
 __author__ = """Ed J"""
 __email__ = 'mohawk2@users.noreply.github.com'
 __version__ = '0.1.2'
 
-from sqlalchemy import inspect
+from sqlalchemy import inspect, select
+from collections import namedtuple
+from functools import lru_cache
+import csv
 import datetime
+import os
+import sys
 import dateutil.parser
 
+# ISO 8601, as written out by denormalising, parses much faster with these,
+# but they are only in Python 3.7+
+_datetime_fromisoformat = getattr(datetime.datetime, 'fromisoformat', None)
+_date_fromisoformat = getattr(datetime.date, 'fromisoformat', None)
+
+def _parse_datetime(v):
+    if _datetime_fromisoformat is not None:
+        try:
+            return _datetime_fromisoformat(v)
+        except ValueError:
+            pass
+    return dateutil.parser.parse(v)
+
+def _parse_date(v):
+    if _date_fromisoformat is not None:
+        try:
+            return _date_fromisoformat(v)
+        except ValueError:
+            pass
+    return dateutil.parser.parse(v).date()
+
+def _parse_bool(v):
+    return v == "True"
+
+
+_TRUE_VALUES = frozenset((
+    'True', 'true', 'TRUE', 't', 'T', '1', 'yes', 'Y', 'y',
+))
+
+def _parse_bool_lenient(v):
+    return v in _TRUE_VALUES
+
+
 _COERCE = {
-    datetime.datetime: dateutil.parser.parse,
-    datetime.date: dateutil.parser.parse,
-    bool: lambda v: v == "True",
+    datetime.datetime: _parse_datetime,
+    datetime.date: _parse_date,
+    bool: _parse_bool,
 }
 
+@lru_cache(maxsize=None)
+def _columns(table):
+    return tuple(inspect(table).columns)
+
+
+_TableMeta = namedtuple('_TableMeta', ['nullables', 'coerceables'])
+
+@lru_cache(maxsize=None)
+def _table_meta(table):
+    # per-table column info, so repeated preparation skips inspection
+    columns = _columns(table)
+    return _TableMeta(
+        nullables=tuple(c.name for c in columns if c.nullable),
+        # only columns that need coercing, so others cost nothing per row
+        coerceables=tuple(
+            (c.name, _COERCE[c.type.python_type])
+            for c in columns if c.type.python_type in _COERCE
+        ),
+    )
+
+def _compile_row_function(name, inplace, body, namespace):
+    # Generates a function of a row dict, with straight-line code specialised
+    # to a table's columns instead of loops over them. Set the environment
+    # variable SQLALCHEMY_CSV_NORMALISE_DEBUG_SRC to see the generated source.
+    lines = [
+        'def %s(d):' % name,
+        '    c = d' if inplace else '    c = dict(d)',
+    ]
+    lines.extend('    ' + line for line in body)
+    lines.append('    return c')
+    src = '\n'.join(lines) + '\n'
+    if os.environ.get('SQLALCHEMY_CSV_NORMALISE_DEBUG_SRC'):
+        print(src, file=sys.stderr)
+    exec(compile(src, '<%s>' % name, 'exec'), namespace)
+    return namespace[name]
+
 def find_natural_key(table):
     """
     Find the natural key from unique columns in table, or return the primary keys.
     """
     primary_keys, foreign_keys, other = columns_partition(table)
+    return _find_natural_key(primary_keys, other)
+
+def _find_natural_key(primary_keys, other):
     natural_keys = [ c for c in other if c.unique ]
     if len(natural_keys) == 1:
         # if >1, can't function as primary key because not unique as composite
@@ -63,7 +151,7 @@ def columns_partition(table):
     This is the most useful way to treat them for these purposes.
     """
     primary_keys, foreign_keys, other = [], [], []
-    for name, c in inspect(table).columns.items():
+    for c in _columns(table):
         if c.foreign_keys:
             foreign_keys.append(c)
         elif c.primary_key:
@@ -74,13 +162,15 @@ def columns_partition(table):
 
 def _tidy_colname(n):
     # simple heuristic
-    import re
-    return re.sub('_id$', '', n)
+    return n[:-3] if n.endswith('_id') else n
 
 def denormalise_prepare(session, table, colname_tidier=_tidy_colname):
-    """Returns SQLAlchemy query, and the column-names it will return.
-    The query will denormalise any foreign keys (FKs) if they refer to a
-    table with a unique column that is not its primary key.
+    """Returns SQLAlchemy Core select statement, and the column-names it
+    will return. Run it with `session.execute`. The statement will
+    denormalise any foreign keys (FKs) if they refer to a table with a
+    unique column that is not its primary key. It is Core rather than an
+    ORM query, as no ORM objects are needed and Core is faster.
+    The `session` is not used, but is kept for compatibility.
 
     The names of any FK columns will have `_id` taken off the end
     as a simple heuristic. Override this by providing a `colname_tidier`.
@@ -88,7 +178,6 @@ def denormalise_prepare(session, table, colname_tidier=_tidy_colname):
     simple_cols, denormalised_cols, to_tables, to_columns, from_columns = \
         _normalisation_info(table)
     q = _denormalise_query(
-        session,
         simple_cols + denormalised_cols,
         to_tables, to_columns, from_columns,
     )
@@ -96,15 +185,42 @@ def denormalise_prepare(session, table, colname_tidier=_tidy_colname):
         [ colname_tidier(c.name) for c in denormalised_cols ]
     return q, col_names
 
-def _denormalise_query(session, columns, to_tables, to_columns, from_columns):
-    q = session.query(*columns)
+def denormalise_stream(session, table, chunk=10000,
+                       colname_tidier=_tidy_colname):
+    """Like `denormalise_prepare`, but executes the statement, returning
+    a result that will fetch `chunk` rows at a time rather than all at
+    once, so it can be iterated over (e.g. by `csv.writer.writerows`)
+    without loading the whole table into memory.
+    With drivers that support it, such as psycopg2 on PostgreSQL, this
+    uses a server-side cursor.
+    """
+    q, col_names = denormalise_prepare(session, table, colname_tidier)
+    result = session.execute(q, execution_options={ 'stream_results': True })
+    return result.yield_per(chunk), col_names
+
+def denormalise_to_csv(session, table, csv_writer, chunk=10000,
+                       colname_tidier=_tidy_colname):
+    """Writes the column-names then all the rows from `denormalise_stream`
+    to the given `csv.writer`. The rows are fetched, and handed to
+    `writerows`, `chunk` at a time.
+    """
+    result, col_names = denormalise_stream(
+        session, table, chunk, colname_tidier,
+    )
+    csv_writer.writerow(col_names)
+    # partitions are the yield_per size
+    for part in result.partitions():
+        csv_writer.writerows(part)
+
+def _denormalise_query(columns, to_tables, to_columns, from_columns):
+    q = select(*columns)
     for to_table, to_column, fk in zip(to_tables, to_columns, from_columns):
         q = q.join(to_table, to_column == fk)
     return q
 
 def _normalisation_info(table):
     primary_keys, foreign_keys, other = columns_partition(table)
-    natural_keys = find_natural_key(table)
+    natural_keys = _find_natural_key(primary_keys, other)
     if [ c for c in natural_keys if c.primary_key ]:
         # not unique columns, real numerical primary keys
         maybe_primary_keys = primary_keys
@@ -113,7 +229,7 @@ def _normalisation_info(table):
     simple_cols = maybe_primary_keys + other
     denormalised_cols, to_tables, to_columns, from_columns = [], [], [], []
     for fk in foreign_keys:
-        to_column = list(fk.foreign_keys)[0].column
+        to_column = next(iter(fk.foreign_keys)).column
         to_table = to_column.table
         remote_natural_keys = find_natural_key(to_table)
         if [ c for c in remote_natural_keys if c.primary_key ]:
@@ -126,51 +242,208 @@ def _normalisation_info(table):
         from_columns.append(fk)
     return simple_cols, denormalised_cols, to_tables, to_columns, from_columns
 
-def empty_deleter(table):
+def empty_deleter(table, inplace=False):
     """Returns function that returns given dict minus empty strings for nullable columns.
     Useful because CSV has no way to record NULL.
+    If `inplace` is true, the given dict is modified and returned rather
+    than copied, which is faster and safe (and recommended) when it is
+    a throwaway, as with `csv.DictReader` rows.
     """
-    nullables = [ c.name for c in inspect(table).columns if c.nullable ]
-    def _row_cleaner(d):
-        c = dict(d)
-        for col in nullables:
-            if c[col] == '': c.pop(col)
-        return c
-    return _row_cleaner
-
-def type_coercer(table):
+    return _make_row_cleaner(table, inplace)
+
+@lru_cache(maxsize=None)
+def _make_row_cleaner(table, inplace):
+    # most rows have no empty values, so check for any in one C-level scan
+    # before testing each nullable column
+    body = [ "if '' in c.values():" ]
+    for col in _table_meta(table).nullables:
+        body.append("    if c.get(%r) == '': del c[%r]" % (col, col))
+    if len(body) == 1:
+        body = []
+    return _compile_row_function('_row_cleaner', inplace, body, {})
+
+def type_coercer(table, inplace=False, strict_bool=True):
     """Returns function that given a row dict will coerce values.
     Works on dates and booleans.
     Will only operate on strings, so if you have pass in a row that has already
     got non-string values, they will not be affected.
+    Booleans are only true if "True", unless `strict_bool` is false, when
+    common spellings such as "true", "t", "1" and "yes" are also true.
+    See `empty_deleter` for `inplace`.
     """
-    coerceables = {}
-    for c in inspect(table).columns:
-        coerceables[c.name] = _COERCE.get(c.type.python_type, lambda x: x)
-    def _row_coercer(d):
-        c = dict(d)
-        for col in c:
-            if isinstance(c[col], str):
-                c[col] = coerceables[col](c[col])
-        return c
-    return _row_coercer
-
-def renormalise_prepare(session, table, colname_tidier=_tidy_colname):
+    return _make_row_coercer(table, inplace, strict_bool)
+
+@lru_cache(maxsize=None)
+def _make_row_coercer(table, inplace, strict_bool):
+    # str and type as globals of the generated function, not builtins,
+    # and c.get bound once per row, to save lookups for each column
+    body, namespace = [ 'get = c.get' ], { 'str': str, 'type': type }
+    for i, (col, coerce) in enumerate(_table_meta(table).coerceables):
+        if not strict_bool and coerce is _parse_bool:
+            coerce = _parse_bool_lenient
+        namespace['C%d' % i] = coerce
+        body.extend((
+            'v = get(%r)' % col,
+            'if type(v) is str: c[%r] = C%d(v)' % (col, i),
+        ))
+    if len(body) == 1:
+        body = []
+    return _compile_row_function('_row_coercer', inplace, body, namespace)
+
+def renormalise_prepare(session, table, colname_tidier=_tidy_colname,
+                        inplace=False):
     """Returns function that will renormalise given dictionary
     Does the inverse of denormalise_prepare.
+    See `empty_deleter` for `inplace`.
     """
+    body, namespace = [], {}
+    lookups = _renormalise_lookups(session, table, colname_tidier)
+    for i, (csv_name, sql_name, lookup) in enumerate(lookups):
+        namespace['L%d' % i] = lookup.__getitem__
+        body.append('c[%r] = L%d(c.pop(%r))' % (sql_name, i, csv_name))
+    # not cached as the lookups depend on the data
+    return _compile_row_function('_row_maker', inplace, body, namespace)
+
+def _renormalise_lookups(session, table, colname_tidier):
+    # list of (CSV column name, SQL column name, dict of natural to surrogate)
     simple_cols, denormalised_cols, to_tables, to_columns, _ = \
         _normalisation_info(table)
     lookups = []
+    str_ = str
     for natural_key, surrogate_key in zip(denormalised_cols, to_columns):
-        lookup_query = session.query(natural_key, surrogate_key)
+        # Core select, streamed, as no ORM objects are needed
+        rows = session.execute(
+            select(natural_key, surrogate_key),
+            execution_options={ 'stream_results': True },
+        )
         # coerce key to string as that's what CSV gives
-        lookup = { str(nat): surr for nat, surr in lookup_query.all() }
-        csv_name = colname_tidier(natural_key.name)
-        lookups.append((csv_name, natural_key.name, lookup))
-    def _row_maker(d):
-        c = dict(d)
-        for csv_name, sql_name, lookup in lookups:
-            c[sql_name] = lookup[c.pop(csv_name)]
-        return c
-    return _row_maker
+        lookup = dict((str_(nat), surr) for nat, surr in rows)
+        name = natural_key.name
+        lookups.append((colname_tidier(name), name, lookup))
+    return lookups
+
+def bulk_load_csv(session, table, dict_iter, batch_size=1000,
+                  colname_tidier=_tidy_colname, inplace=False,
+                  strict_bool=True):
+    """Renormalises, cleans and coerces each dict from `dict_iter` (e.g. a
+    `csv.DictReader`), and inserts them into the table in batches of
+    `batch_size` using `session.bulk_insert_mappings`. This is much faster
+    than adding an ORM object per row. See `empty_deleter` for `inplace`,
+    and `type_coercer` for `strict_bool`.
+
+    The default batch size suits most tables; for tables with very small
+    rows, a smaller size (around 50) can do as well or better.
+    Does not commit.
+    """
+    # unless inplace, row_maker copies each dict, so the caller's are left
+    # alone, and the rest can work on that copy
+    row_maker = renormalise_prepare(session, table, colname_tidier, inplace)
+    row_cleaner = empty_deleter(table, inplace=True)
+    row_coercer = type_coercer(table, inplace=True, strict_bool=strict_bool)
+    batch = []
+    for d in dict_iter:
+        batch.append(row_coercer(row_cleaner(row_maker(d))))
+        if len(batch) >= batch_size:
+            session.bulk_insert_mappings(table, batch)
+            batch = []
+    if batch:
+        session.bulk_insert_mappings(table, batch)
+
+def renormalise_arrow(session, table, path, batch_size=1000,
+                      colname_tidier=_tidy_colname, strict_bool=True):
+    """Like `bulk_load_csv`, but reads the CSV file at `path` with
+    `pyarrow`, which parses and converts whole columns at a time in C++
+    rather than a row at a time in Python. This is much faster for large
+    files. Dates and datetimes must be ISO 8601, as written by
+    `denormalise_stream`.
+
+    If `pyarrow` 7.0 or later is not installed, falls back to
+    `bulk_load_csv`.
+    See `type_coercer` for `strict_bool`.
+    Does not commit.
+    """
+    pyarrow = _import_pyarrow()
+    if pyarrow is None:
+        with open(path, newline='') as csv_file:
+            bulk_load_csv(session, table, csv.DictReader(csv_file),
+                          batch_size, colname_tidier, inplace=True,
+                          strict_bool=strict_bool)
+        return
+    pc = pyarrow.compute
+    true_values = pyarrow.array(list(_TRUE_VALUES), type=pyarrow.string())
+    lookups = _renormalise_lookups(session, table, colname_tidier)
+    column_types = {}
+    nullables = set(_table_meta(table).nullables)
+    bools = set()
+    for c in _columns(table):
+        if c.type.python_type is bool:
+            # read as strings, to match type_coercer
+            bools.add(c.name)
+            arrow_type = pyarrow.string()
+        else:
+            arrow_type = _arrow_type(c)
+        if arrow_type is not None:
+            column_types[c.name] = arrow_type
+    # after the table's columns, as an FK's CSV name can be the same as its own
+    for csv_name, _, _ in lookups:
+        column_types[csv_name] = pyarrow.string()
+    data = pyarrow.csv.read_csv(
+        path,
+        convert_options=pyarrow.csv.ConvertOptions(column_types=column_types),
+    )
+    for name in data.column_names:
+        col = data[name]
+        if name in nullables and pyarrow.types.is_string(col.type):
+            # as for empty_deleter
+            col = pc.if_else(pc.equal(col, ''), None, col)
+        if name in bools:
+            if strict_bool:
+                col = pc.equal(col, 'True')
+            else:
+                col = pc.is_in(col, value_set=true_values)
+        data = data.set_column(data.schema.get_field_index(name), name, col)
+    columns = { c.name: c for c in _columns(table) }
+    for csv_name, sql_name, lookup in lookups:
+        col = data[csv_name]
+        # explicit types, as an empty lookup table would otherwise give nulls
+        value_set = pyarrow.array(list(lookup), type=pyarrow.string())
+        indices = pc.index_in(col, value_set=value_set)
+        if indices.null_count > col.null_count:
+            raise KeyError('%s: value not found in lookup table' % csv_name)
+        surrogates = pyarrow.array(
+            list(lookup.values()),
+            type=_arrow_type(columns[sql_name]),
+        )
+        col = pc.take(surrogates, indices)
+        i = data.schema.get_field_index(csv_name)
+        data = data.set_column(i, sql_name, col)
+    for batch in data.to_batches(max_chunksize=batch_size):
+        session.bulk_insert_mappings(table, batch.to_pylist())
+
+def _import_pyarrow():
+    # optional, and slow to import, so only imported when used; 7.0 added
+    # RecordBatch.to_pylist
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.csv
+    except ImportError:
+        return None
+    if int(pyarrow.__version__.split('.')[0]) < 7:
+        return None
+    return pyarrow
+
+def _arrow_type(column):
+    # others are left to pyarrow's type inference
+    import pyarrow
+    python_type = column.type.python_type
+    if python_type is datetime.datetime and column.type.timezone:
+        # values with a UTC offset, as written for these, need a zone
+        return pyarrow.timestamp('us', tz='UTC')
+    return {
+        int: pyarrow.int64(),
+        float: pyarrow.float64(),
+        str: pyarrow.string(),
+        datetime.datetime: pyarrow.timestamp('us'),
+        datetime.date: pyarrow.date32(),
+    }.get(python_type)
@@ -4,17 +4,24 @@ import pytest
 from sqlalchemy import (
     create_engine,
     Column, ForeignKey,
-    Integer, String, Boolean,
+    Integer, String, Boolean, Date, DateTime,
 )
+import datetime
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
 from sqlalchemy_csv_normalise import (
     denormalise_prepare,
+    denormalise_stream,
+    denormalise_to_csv,
     renormalise_prepare,
     empty_deleter,
     type_coercer,
+    bulk_load_csv,
+    renormalise_arrow,
 )
+import csv
+import sys
 
 _db_uri = 'sqlite:///:memory:'
 engine = create_engine(_db_uri)
@@ -62,6 +69,29 @@ csv_rows_extract_expect = [
     { 'username': 'noname', 'name': '', 'accounttype': 'user', 'age': 33, 'valid': False, 'nonk_id': 1 },
 ]
 
+csv_rows_load_in = [
+    { 'username': 'bob', 'name': 'Big Bob', 'accounttype': 'admin', 'age': '31', 'valid': 'True', 'nonk_id': '1' },
+    { 'username': 'joe', 'name': 'Regular Joe', 'accounttype': 'user', 'age': '32', 'valid': 'False', 'nonk_id': '2' },
+    { 'username': 'noname', 'name': '', 'accounttype': 'user', 'age': '33', 'valid': 'False', 'nonk_id': '' },
+]
+csv_rows_load_expect = [
+    ( 'bob', 'Big Bob', 1, 31, True, 1 ),
+    ( 'joe', 'Regular Joe', 2, 32, False, 2 ),
+    ( 'noname', None, 2, 33, False, None ),
+]
+csv_rows_load_lenient_in = [
+    { **r, 'valid': v } for r, v in zip(csv_rows_load_in, ('true', '1', 'no'))
+]
+
+csv_rows_dates_in = [
+    { 'id': '1', 'day': '2020-02-01', 'at': '2020-02-01 12:34:56' },
+    { 'id': '2', 'day': '1 Feb 2020', 'at': '1 Feb 2020 12:34:56' },
+]
+csv_rows_dates_expect = [
+    { 'id': '1', 'day': datetime.date(2020, 2, 1), 'at': datetime.datetime(2020, 2, 1, 12, 34, 56) },
+    { 'id': '2', 'day': datetime.date(2020, 2, 1), 'at': datetime.datetime(2020, 2, 1, 12, 34, 56) },
+]
+
 class LookupNoNKTable(Base):
     __tablename__ = 'lookup_nonk_table'
     id = Column(Integer, primary_key=True)
@@ -82,6 +112,18 @@ class NormalisedTable(Base):
     valid = Column(Boolean, nullable=False)
     nonk_id = Column(Integer, ForeignKey(LookupNoNKTable.id), nullable=True)
 
+class DatedTable(Base):
+    __tablename__ = 'dated_table'
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    at = Column(DateTime, nullable=False)
+    at_tz = Column(DateTime(timezone=True), nullable=True)
+
+class KindedTable(Base):
+    __tablename__ = 'kinded_table'
+    id = Column(Integer, primary_key=True)
+    kind = Column(Integer, ForeignKey(LookupTable.id), nullable=False) # no _id
+
 @pytest.fixture
 def db_session():
     Base.metadata.drop_all(engine)
@@ -99,11 +141,38 @@ def test_empty_deleter():
     for input, expected in zip(csv_rows_delete_in, csv_rows_delete_expect):
         assert f(input) == expected
 
+def test_empty_deleter_inplace():
+    f = empty_deleter(NormalisedTable, inplace=True)
+    for input, expected in zip(csv_rows_delete_in, csv_rows_delete_expect):
+        d = dict(input)
+        assert f(d) is d
+        assert d == expected
+
 def test_type_coercer():
     f = type_coercer(NormalisedTable)
     for input, expected in zip(csv_rows_coerce_in, csv_rows_coerce_expect):
         assert f(input) == expected
 
+def test_type_coercer_lenient_bool():
+    f = type_coercer(NormalisedTable)
+    g = type_coercer(NormalisedTable, strict_bool=False)
+    for v, expected in [ ('True', True), ('true', True), ('1', True),
+            ('yes', True), ('False', False), ('0', False), ('no', False) ]:
+        assert f({ 'valid': v }) == { 'valid': v == 'True' }
+        assert g({ 'valid': v }) == { 'valid': expected }
+
+def test_type_coercer_dates():
+    f = type_coercer(DatedTable)
+    for input, expected in zip(csv_rows_dates_in, csv_rows_dates_expect):
+        assert f(input) == expected
+
+def test_type_coercer_inplace():
+    f = type_coercer(NormalisedTable, inplace=True)
+    for input, expected in zip(csv_rows_coerce_in, csv_rows_coerce_expect):
+        d = dict(input)
+        assert f(d) is d
+        assert d == expected
+
 def test_renormalise_prepare(db_session):
     f = renormalise_prepare(db_session, NormalisedTable)
     for input, expected in zip(csv_rows_make_in, csv_rows_make_expect):
@@ -115,15 +184,148 @@ def test_denormalise_prepare(db_session):
     db_session.commit()
     q, col_names = denormalise_prepare(db_session, NormalisedTable)
     for got, expected in zip(
-        [ dict(zip(col_names, r)) for r in q.all() ],
+        [ dict(zip(col_names, r)) for r in db_session.execute(q) ],
         csv_rows_extract_expect,
     ):
         assert got == expected
 
+def test_denormalise_stream(db_session):
+    for r in csv_rows_extract_in:
+        db_session.add(NormalisedTable(**r))
+    db_session.commit()
+    q, col_names = denormalise_stream(db_session, NormalisedTable, chunk=2)
+    got = [ dict(zip(col_names, r)) for r in q ]
+    assert got == csv_rows_extract_expect
+
+def test_denormalise_to_csv(db_session, tmp_path):
+    for r in csv_rows_extract_in:
+        db_session.add(NormalisedTable(**r))
+    db_session.commit()
+    path = tmp_path / 'normalised_table.csv'
+    with open(path, 'w', newline='') as csv_file:
+        denormalise_to_csv(db_session, NormalisedTable, csv.writer(csv_file),
+            chunk=2)
+    with open(path, newline='') as csv_file:
+        got = list(csv.DictReader(csv_file))
+    assert got == [ { k: str(v) for k, v in r.items() }
+        for r in csv_rows_extract_expect ]
+
 def test_denormalise_prepare_nonk(db_session):
     q, col_names = denormalise_prepare(db_session, LookupNoNKTable)
     for got, expected in zip(
-        [ dict(zip(col_names, r)) for r in q.all() ],
+        [ dict(zip(col_names, r)) for r in db_session.execute(q) ],
         [ { **r, 'id': id } for id, r in enumerate(lookup_nonk_rows, 1) ],
     ):
         assert got == expected
+
+def _write_csv(path, rows):
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+def _loaded_rows(session):
+    t = NormalisedTable
+    got = session.query(
+        t.username, t.name, t.accounttype_id, t.age, t.valid, t.nonk_id,
+    ).order_by(t.id).all()
+    return [ tuple(r) for r in got ]
+
+def test_bulk_load_csv(db_session):
+    bulk_load_csv(db_session, NormalisedTable, csv_rows_load_in, batch_size=2)
+    db_session.commit()
+    assert _loaded_rows(db_session) == csv_rows_load_expect
+
+def test_bulk_load_csv_inplace(db_session, tmp_path):
+    path = tmp_path / 'normalised_table.csv'
+    _write_csv(path, csv_rows_load_in)
+    with open(path, newline='') as csv_file:
+        bulk_load_csv(db_session, NormalisedTable, csv.DictReader(csv_file),
+            inplace=True)
+    db_session.commit()
+    assert _loaded_rows(db_session) == csv_rows_load_expect
+
+def test_renormalise_arrow(db_session, tmp_path):
+    pytest.importorskip('pyarrow')
+    path = tmp_path / 'normalised_table.csv'
+    _write_csv(path, csv_rows_load_in)
+    renormalise_arrow(db_session, NormalisedTable, str(path), batch_size=2)
+    db_session.commit()
+    assert _loaded_rows(db_session) == csv_rows_load_expect
+
+def test_renormalise_arrow_fallback(db_session, tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    path = tmp_path / 'normalised_table.csv'
+    _write_csv(path, csv_rows_load_in)
+    renormalise_arrow(db_session, NormalisedTable, str(path), batch_size=2)
+    db_session.commit()
+    assert _loaded_rows(db_session) == csv_rows_load_expect
+
+def test_renormalise_arrow_old_pyarrow(db_session, tmp_path, monkeypatch):
+    pyarrow = pytest.importorskip('pyarrow')
+    pyarrow_csv = pytest.importorskip('pyarrow.csv')
+    monkeypatch.setattr(pyarrow, '__version__', '6.0.1')
+    # must not be used
+    monkeypatch.setattr(pyarrow_csv, 'read_csv', None)
+    path = tmp_path / 'normalised_table.csv'
+    _write_csv(path, csv_rows_load_in)
+    renormalise_arrow(db_session, NormalisedTable, str(path), batch_size=2)
+    db_session.commit()
+    assert _loaded_rows(db_session) == csv_rows_load_expect
+
+def test_renormalise_arrow_empty_lookup(db_session, tmp_path):
+    pytest.importorskip('pyarrow')
+    db_session.query(LookupTable).delete()
+    db_session.commit()
+    path = tmp_path / 'normalised_table.csv'
+    with open(path, 'w', newline='') as csv_file:
+        csv.writer(csv_file).writerow(list(csv_rows_load_in[0]))
+    renormalise_arrow(db_session, NormalisedTable, str(path))
+    db_session.commit()
+    assert _loaded_rows(db_session) == []
+    _write_csv(path, csv_rows_load_in)
+    with pytest.raises(KeyError):
+        renormalise_arrow(db_session, NormalisedTable, str(path))
+
+def test_renormalise_arrow_timezone(db_session, tmp_path):
+    pytest.importorskip('pyarrow')
+    path = tmp_path / 'dated_table.csv'
+    _write_csv(path, [
+        { 'id': '1', 'day': '2020-01-02', 'at': '2020-01-02 03:04:05',
+            'at_tz': '2020-01-02 03:04:05+01:00' },
+    ])
+    renormalise_arrow(db_session, DatedTable, str(path))
+    db_session.commit()
+    got = db_session.query(DatedTable).one()
+    assert got.day == datetime.date(2020, 1, 2)
+    assert got.at == datetime.datetime(2020, 1, 2, 3, 4, 5)
+    # SQLite does not keep the zone, but the value is converted to UTC
+    assert got.at_tz.replace(tzinfo=None) == datetime.datetime(2020, 1, 2, 2, 4, 5)
+
+def test_renormalise_arrow_fk_no_id_suffix(db_session, tmp_path):
+    pytest.importorskip('pyarrow')
+    path = tmp_path / 'kinded_table.csv'
+    _write_csv(path, [
+        { 'id': '1', 'kind': 'user' },
+        { 'id': '2', 'kind': 'admin' },
+    ])
+    renormalise_arrow(db_session, KindedTable, str(path))
+    db_session.commit()
+    t = KindedTable
+    got = db_session.query(t.id, t.kind).order_by(t.id).all()
+    assert [ tuple(r) for r in got ] == [ (1, 2), (2, 1) ]
+
+def test_bulk_load_csv_lenient_bool(db_session):
+    bulk_load_csv(db_session, NormalisedTable, csv_rows_load_lenient_in,
+                  strict_bool=False)
+    db_session.commit()
+    assert [ r[4] for r in _loaded_rows(db_session) ] == [ True, True, False ]
+
+def test_renormalise_arrow_lenient_bool(db_session, tmp_path):
+    pytest.importorskip('pyarrow')
+    path = tmp_path / 'normalised_table.csv'
+    _write_csv(path, csv_rows_load_lenient_in)
+    renormalise_arrow(db_session, NormalisedTable, str(path),
+                      strict_bool=False)
+    db_session.commit()
+    assert [ r[4] for r in _loaded_rows(db_session) ] == [ True, True, False ]